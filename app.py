@@ -1,9 +1,25 @@
 import streamlit as st
-import yfinance as yf
-import plotly.graph_objs as go
 import pandas as pd
-import time
-from datetime import datetime
+import re
+from pathlib import Path
+
+from trading_core import (
+    empty_portfolio, empty_history, get_data, get_live_data, fill_last_good, build_fig,
+    execute_trade, render_portfolio, QUOTE_PERIOD, QUOTE_INTERVAL
+)
+
+# Chart colours; the page chrome lives in static/protrade.css
+THEME = {
+    'axis': '#8B949E',
+    'grid': '#30363D',
+    'up': '#3D9970',
+    'down': '#FF4136',
+    'sma': 'orange',
+    'template': 'plotly_dark',
+}
+
+METRIC_LABELS = ("Price", "High", "Low", "Volume")
+HISTORY_ROWS = 500
 
 # -----------------------------------------------------------------------------
 # 1. Page Config & CSS (The Pro Design)
@@ -14,44 +30,30 @@ st.set_page_config(
     layout="wide"
 )
 
-st.markdown("""
-<style>
-    /* Global Dark Theme */
-    .stApp { background-color: #0E1117; font-family: 'Inter', sans-serif; }
-    [data-testid="stSidebar"] { background-color: #161B22; border-right: 1px solid #30363D; }
+@st.cache_resource
+def load_css():
+    """
+    Reads and minifies the stylesheet once per server process; reruns reuse the tag.
+    It still has to be emitted every rerun (Streamlit drops elements a rerun skips),
+    so stripping comments/whitespace keeps that per-rerun payload small.
+    """
+    css = (Path(__file__).parent / "static" / "protrade.css").read_text()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", re.sub(r"\s+", " ", css)).strip()
+    return f"<style>{css}</style>"
 
-    /* Metrics & Tables */
-    div[data-testid="stMetric"] {
-        background-color: #21262D;
-        border: 1px solid #30363D;
-        padding: 15px;
-        border-radius: 8px;
-    }
-    [data-testid="stDataFrame"] { border: 1px solid #30363D; border-radius: 8px; }
-    
-    /* Buttons */
-    button[kind="primary"] {
-        background-color: #238636 !important;
-        border: 1px solid #2EA043 !important;
-        color: white !important;
-    }
-    button[kind="secondary"] {
-        background-color: #DA3633 !important;
-        border: 1px solid #F85149 !important;
-        color: white !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
 # 2. Session State Setup
 # -----------------------------------------------------------------------------
-if 'balance' not in st.session_state:
-    st.session_state.balance = 100000.00
+# Money is tracked in integer cents so trade math is exact (no float drift)
+if 'balance_cents' not in st.session_state:
+    st.session_state.balance_cents = 10_000_000
 if 'portfolio' not in st.session_state:
-    st.session_state.portfolio = {}
-if 'transactions' not in st.session_state:
-    st.session_state.transactions = []
+    st.session_state.portfolio = empty_portfolio()
+if 'hist_df' not in st.session_state:
+    st.session_state.hist_df = empty_history()
 
 # -----------------------------------------------------------------------------
 # 3. Sidebar Controls
@@ -60,138 +62,71 @@ st.sidebar.title("⚡ ProTrade")
 ticker_symbol = st.sidebar.text_input("Ticker Symbol", "AAPL").upper()
 time_period = st.sidebar.selectbox("Time Period", ["1d", "5d", "1mo", "6mo"], index=0)
 chart_interval = st.sidebar.selectbox("Interval", ["1m", "5m", "15m", "1h", "1d"], index=0)
+live_mode = st.sidebar.toggle("🔴 Live Mode", value=False)
+refresh_rate = st.sidebar.slider("Refresh (s)", 2, 60, 10, disabled=not live_mode)
+
+# Live mode: the browser schedules a normal rerun every refresh_rate seconds, so
+# no Python thread sleeps in a loop and sidebar edits apply on the next tick.
+if live_mode:
+    from streamlit_autorefresh import st_autorefresh
+    st_autorefresh(interval=refresh_rate * 1000, key="tick")
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("💰 Account")
-# Display balance rounded strictly to 2 decimals
-st.sidebar.metric("Cash Balance", f"${st.session_state.balance:,.2f}")
+# Cents are only converted to dollars for display
+st.sidebar.metric("Cash Balance", f"${st.session_state.balance_cents / 100:,.2f}")
 
 if st.sidebar.button("🔄 Reset Account"):
-    st.session_state.balance = 100000.00
-    st.session_state.portfolio = {}
-    st.session_state.transactions = []
+    st.session_state.balance_cents = 10_000_000
+    st.session_state.portfolio = empty_portfolio()
+    st.session_state.hist_df = empty_history()
     st.rerun()
 
 # -----------------------------------------------------------------------------
-# 4. Robust Data Functions (FIXED)
-# -----------------------------------------------------------------------------
-def get_data(symbol, period, interval):
-    """Fetches data for the Main Chart."""
-    try:
-        df = yf.download(tickers=symbol, period=period, interval=interval, progress=False)
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-        df.reset_index(inplace=True)
-        df.columns = [c.capitalize() for c in df.columns]
-        return df
-    except Exception as e:
-        return pd.DataFrame()
-
-def get_current_price(symbol):
-    """Helper to get a single float price for a stock right now."""
-    try:
-        # We fetch 1 day of data to get the absolute latest close
-        df = yf.download(tickers=symbol, period="1d", interval="1m", progress=False)
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-        if not df.empty:
-            return round(df['Close'].iloc[-1], 2)
-        return 0.0
-    except:
-        return 0.0
-
-def execute_trade(action, symbol, price, qty):
-    """
-    Executes trade with STRICT rounding to 2 decimals 
-    to prevent floating point errors (e.g., 99999.99999).
-    """
-    price = round(price, 2) # Force price to 2 decimals
-    cost = round(price * qty, 2)
-    
-    if action == "BUY":
-        if st.session_state.balance >= cost:
-            # Deduct Cash
-            st.session_state.balance = round(st.session_state.balance - cost, 2)
-            
-            # Update Portfolio
-            if symbol in st.session_state.portfolio:
-                old_qty = st.session_state.portfolio[symbol]['qty']
-                old_avg = st.session_state.portfolio[symbol]['avg_price']
-                
-                # Calculate new weighted average
-                # (Old Total Val + New Cost) / Total Qty
-                new_avg = ((old_avg * old_qty) + cost) / (old_qty + qty)
-                
-                st.session_state.portfolio[symbol]['qty'] += qty
-                st.session_state.portfolio[symbol]['avg_price'] = round(new_avg, 2)
-            else:
-                st.session_state.portfolio[symbol] = {'qty': qty, 'avg_price': price}
-            
-            # Log
-            st.session_state.transactions.append({
-                "Date": datetime.now(), "Type": "BUY", "Symbol": symbol, 
-                "Price": price, "Qty": qty, "Total": -cost
-            })
-            st.success(f"Bought {qty} {symbol} @ ${price}")
-        else:
-            st.error("❌ Insufficient Funds")
-            
-    elif action == "SELL":
-        if symbol in st.session_state.portfolio and st.session_state.portfolio[symbol]['qty'] >= qty:
-            # Add Cash
-            st.session_state.balance = round(st.session_state.balance + cost, 2)
-            
-            # Update Portfolio
-            st.session_state.portfolio[symbol]['qty'] -= qty
-            
-            # Remove if 0
-            if st.session_state.portfolio[symbol]['qty'] == 0:
-                del st.session_state.portfolio[symbol]
-            
-            # Log
-            st.session_state.transactions.append({
-                "Date": datetime.now(), "Type": "SELL", "Symbol": symbol, 
-                "Price": price, "Qty": qty, "Total": cost
-            })
-            st.success(f"Sold {qty} {symbol} @ ${price}")
-        else:
-            st.error("❌ Insufficient Shares")
-
-# -----------------------------------------------------------------------------
-# 5. Main Dashboard
+# 4. Main Dashboard
 # -----------------------------------------------------------------------------
 st.title(f"{ticker_symbol} Market Terminal")
 
-# 1. Get Data
-df = get_data(ticker_symbol, time_period, chart_interval)
+# 1. Get Data: the active symbol at the chart's period/interval, and every held symbol's
+# latest 1-minute bar for valuation (one batch when the chart is QUOTE_PERIOD/QUOTE_INTERVAL too)
+held = tuple(st.session_state.portfolio['symbols'])
+chart_is_quote = (time_period, chart_interval) == (QUOTE_PERIOD, QUOTE_INTERVAL)
+needed = tuple(sorted(t for t in {ticker_symbol, *(held if chart_is_quote else ())} if t))
+if live_mode:
+    market_data = get_live_data(needed, time_period, chart_interval, refresh_rate)
+else:
+    st.session_state.pop('live_frames', None)
+    market_data = get_data(needed, time_period, chart_interval)
+market_data, stale = fill_last_good(market_data, needed, time_period, chart_interval)
+if chart_is_quote:
+    quotes = market_data
+else:
+    quotes = get_data(held, QUOTE_PERIOD, QUOTE_INTERVAL, refresh_rate if live_mode else None)
+    quotes, stale_quotes = fill_last_good(quotes, held, QUOTE_PERIOD, QUOTE_INTERVAL)
+    stale = tuple(sorted({*stale, *stale_quotes}))
+if stale:
+    st.warning(f"Download failed for {', '.join(stale)} - showing the last data received.")
+df = market_data.get(ticker_symbol, pd.DataFrame())
 
 if not df.empty:
-    latest_close = round(df['Close'].iloc[-1], 2)
-    prev_close = df['Close'].iloc[-2] if len(df) > 1 else latest_close
-    diff = round(latest_close - prev_close, 2)
-    pct = round((diff / prev_close) * 100, 2)
-
-    # 2. Metrics
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Price", f"${latest_close}", f"{diff} ({pct}%)")
-    c2.metric("High", f"${df['High'].iloc[-1]:.2f}")
-    c3.metric("Low", f"${df['Low'].iloc[-1]:.2f}")
-    c4.metric("Volume", f"{df['Volume'].iloc[-1]:,}")
+    # The metric row reads the chart's frame, already in memory - no separate quote request.
+    # Scalars come straight from the NumPy buffers, skipping pandas' indexing machinery
+    close_arr = df['Close'].to_numpy()
+    latest_close = round(float(close_arr[-1]), 2)
+    prev_close = float(close_arr[-2]) if close_arr.size > 1 else latest_close
+    diff = latest_close - prev_close
+    # A zero previous close (bad or halted bar) would raise on plain float division
+    pct = diff / prev_close * 100 if prev_close else 0.0
+
+    # 2. Metrics (format everything up front, then emit; the format specs do the rounding)
+    high, low, volume = (df[col].to_numpy()[-1] for col in ('High', 'Low', 'Volume'))
+    values = (f"${latest_close:.2f}", f"${high:.2f}", f"${low:.2f}", f"{int(volume):,}")
+    deltas = (f"{diff:+.2f} ({pct:+.2f}%)", None, None, None)
+    for col, label, value, delta in zip(st.columns(4), METRIC_LABELS, values, deltas):
+        col.metric(label, value, delta)
 
     # 3. Chart
-    fig = go.Figure()
-    fig.add_trace(go.Candlestick(
-        x=df.iloc[:, 0], open=df['Open'], high=df['High'], 
-        low=df['Low'], close=df['Close'], name=ticker_symbol
-    ))
-    fig.update_layout(
-        height=500, margin=dict(t=20, b=0, l=0, r=0),
-        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
-        xaxis=dict(showgrid=False, color='#8B949E'),
-        yaxis=dict(showgrid=True, gridcolor='#30363D', color='#8B949E'),
-        template="plotly_dark"
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(build_fig(df, ticker_symbol, THEME), use_container_width=True)
 
     # 4. Trading Panel
     st.markdown("### ⚡ Quick Trade")
@@ -213,77 +148,19 @@ else:
     st.warning("Ticker not found or market data unavailable.")
 
 # -----------------------------------------------------------------------------
-# 6. Portfolio Logic (FIXED VALUATION)
+# 5. Portfolio & History
 # -----------------------------------------------------------------------------
 st.markdown("---")
 tab_p, tab_h = st.tabs(["💼 Portfolio", "📝 History"])
 
 with tab_p:
-    if st.session_state.portfolio:
-        # To fix the "Math Error", we need REAL TIME prices for EVERYTHING in the portfolio
-        # not just the active stock.
-        
-        portfolio_tickers = list(st.session_state.portfolio.keys())
-        
-        # Batch fetch latest prices for portfolio to ensure Net Worth is accurate
-        # If only 1 ticker in portfolio, use current data, else fetch batch
-        live_prices = {}
-        
-        if len(portfolio_tickers) > 0:
-            try:
-                # Quick fetch of 1 minute data for all held stocks
-                p_data = yf.download(portfolio_tickers, period="1d", interval="1m", progress=False)['Close']
-                
-                # Handle case where p_data is Series (1 stock) or DataFrame (multiple)
-                if isinstance(p_data, pd.Series):
-                    live_prices[portfolio_tickers[0]] = round(p_data.iloc[-1], 2)
-                else:
-                    for t in portfolio_tickers:
-                        # Check if column exists (sometimes yfinance drops invalid tickers)
-                        if t in p_data.columns:
-                            live_prices[t] = round(p_data[t].iloc[-1], 2)
-                        else:
-                            # Fallback to avg price if fetch fails
-                            live_prices[t] = st.session_state.portfolio[t]['avg_price']
-            except:
-                pass
-
-        # Build Table
-        rows = []
-        total_equity = 0.0
-        
-        for sym, data in st.session_state.portfolio.items():
-            # Get live price from our batch fetch, or fallback to current screen if matches
-            current_price = live_prices.get(sym, data['avg_price'])
-            if sym == ticker_symbol: current_price = latest_close # Use most fresh data for active symbol
-            
-            qty = data['qty']
-            avg_price = data['avg_price']
-            
-            market_val = round(current_price * qty, 2)
-            total_equity += market_val
-            
-            unrealized_pl = round(market_val - (avg_price * qty), 2)
-            
-            rows.append({
-                "Symbol": sym,
-                "Qty": qty,
-                "Avg Cost": f"${avg_price:.2f}",
-                "Current Price": f"${current_price:.2f}",
-                "Market Value": f"${market_val:,.2f}",
-                "Unrealized P/L": f"${unrealized_pl:,.2f}"
-            })
-            
-        # Final Net Worth Calculation
-        net_worth = round(st.session_state.balance + total_equity, 2)
-        
-        st.metric("Total Net Worth", f"${net_worth:,.2f}")
-        st.dataframe(pd.DataFrame(rows), use_container_width=True)
-        
-    else:
-        st.info("Portfolio is empty. Buy stocks to see them here.")
+    render_portfolio(quotes, ticker_symbol, None if df.empty else latest_close)
 
 with tab_h:
-    if st.session_state.transactions:
-        hist_df = pd.DataFrame(st.session_state.transactions)
-        st.dataframe(hist_df.sort_values(by="Date", ascending=False), use_container_width=True)
\ No newline at end of file
+    hist = st.session_state.hist_df
+    if not hist.empty:
+        # Newest first via a reversed slice - rows are already in time order.
+        # Only the latest HISTORY_ROWS are shipped to the browser; the full log is kept.
+        st.dataframe(hist.iloc[::-1].head(HISTORY_ROWS), use_container_width=True)
+        if len(hist) > HISTORY_ROWS:
+            st.caption(f"Showing the latest {HISTORY_ROWS:,} of {len(hist):,} transactions.")
\ No newline at end of file
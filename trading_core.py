@@ -0,0 +1,488 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import time
+import threading
+import concurrent.futures
+
+# yfinance and plotly are heavy to import and only needed once data arrives,
+# so they are imported inside the functions that use them (sys.modules caches them).
+
+# -----------------------------------------------------------------------------
+# 1. Session State Shapes
+# -----------------------------------------------------------------------------
+def empty_portfolio():
+    """
+    Holdings as parallel NumPy arrays (struct-of-arrays), kept sorted by
+    symbol so lookups are a binary search via np.searchsorted.
+    Average cost is stored in integer cents, like the cash balance.
+    """
+    return {
+        'symbols': np.array([], dtype=object),
+        'qty': np.zeros(0, dtype=np.int64),
+        'avg_cents': np.zeros(0, dtype=np.int64),
+    }
+
+# Type/Symbol are dictionary-encoded (int8 codes) instead of one Python str per row.
+# Symbol categories grow as new tickers are traded.
+HISTORY_COLUMNS = {
+    'Date': 'datetime64[ns]', 'Type': pd.CategoricalDtype(['BUY', 'SELL']),
+    'Symbol': pd.CategoricalDtype([]), 'Price': 'float64', 'Qty': 'int64', 'Total': 'float64'
+}
+
+def empty_history():
+    """
+    Transaction log as a typed DataFrame that each trade appends one row to.
+    Rows go in time order, so it never needs sorting.
+    """
+    return pd.DataFrame(columns=list(HISTORY_COLUMNS)).astype(HISTORY_COLUMNS)
+
+# -----------------------------------------------------------------------------
+# 2. Robust Data Functions
+# -----------------------------------------------------------------------------
+# Downloads are I/O-bound, so the pool can be wider than the core count
+MAX_FETCH_WORKERS = 16
+OHLCV = ['Open', 'High', 'Low', 'Close', 'Volume']
+# Tries per download; waits between them double from 0.2s
+FETCH_ATTEMPTS = 3
+
+@st.cache_resource
+def http_session():
+    """
+    One HTTP session for every download, so live ticks reuse open TLS connections
+    instead of handshaking per request. curl_cffi gives each pool thread its own
+    curl handle (and connection cache), so sharing it across threads is safe.
+    """
+    from curl_cffi import requests as curl_requests
+
+    # Same browser impersonation yfinance uses for the sessions it creates itself
+    return curl_requests.Session(impersonate="chrome")
+
+class DownloadFailed(Exception):
+    """
+    A download that failed for a transient reason (network error, rate limit),
+    as opposed to Yahoo having no data for the request. It is not cached.
+    """
+
+def fetch_symbol(symbol, period, interval, session=None):
+    """
+    Downloads one symbol's OHLCV as a flat DataFrame indexed by timestamp.
+    Only network errors are retried, with exponential backoff; if the last attempt
+    fails too (or Yahoo rate-limits) it raises DownloadFailed. Yahoo answering with
+    no data - an unknown ticker, or a period/interval pair it does not serve - is
+    final and comes back as an empty frame.
+    """
+    import yfinance as yf
+    from curl_cffi.requests.exceptions import RequestException
+    from yfinance.exceptions import YFException, YFRateLimitError
+
+    # Raise instead of log-and-return-empty, so a network failure and "no data"
+    # can be told apart (yf.download swallows both, hence Ticker.history)
+    yf.config.debug.hide_exceptions = False
+    ticker = yf.Ticker(symbol, session=session)
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            df = ticker.history(period=period, interval=interval)
+        except YFRateLimitError as e:
+            raise DownloadFailed(symbol) from e
+        except YFException:
+            return pd.DataFrame(columns=OHLCV)
+        except RequestException as e:
+            if attempt + 1 == FETCH_ATTEMPTS:
+                raise DownloadFailed(symbol) from e
+            time.sleep(0.2 * 2 ** attempt)
+            continue
+        if df.empty:
+            return pd.DataFrame(columns=OHLCV)
+        # History columns are flat and already canonically named; keep only what is used
+        return df[OHLCV]
+
+# One pool for the whole server process, shared by every session's cache misses
+_FETCH_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS)
+# Downloads currently running, keyed by (symbol, period, interval)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def fetch_shared(symbol, period, interval, session=None):
+    """
+    Returns a Future for one download, joining an identical one already in flight.
+    The download cache is also keyed by time window; this joins requests whose
+    windows differ (e.g. sessions with different live refresh rates).
+    """
+    key = (symbol, period, interval)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        future = _inflight[key] = _FETCH_POOL.submit(fetch_symbol, *key, session)
+
+    def done(f):
+        with _inflight_lock:
+            if _inflight.get(key) is f:
+                del _inflight[key]
+    # Registered outside the lock: it runs inline if the download already finished
+    future.add_done_callback(done)
+    return future
+
+def data_ttl(interval):
+    """Seconds a download stays fresh: intraday bars move every minute, daily bars barely do."""
+    return 300 if interval == "1d" else 60
+
+def get_data(symbols, period, interval, max_age=None):
+    """
+    Fetches data for the Main Chart AND the portfolio, cached per (symbol, period, interval).
+    max_age (seconds) tightens freshness below data_ttl(interval), e.g. for live mode.
+    Returns {symbol: DataFrame}. Symbols Yahoo has no data for are left out, and that
+    answer is cached like a frame; failed downloads are left out but not cached.
+    """
+    ttl = data_ttl(interval) if max_age is None else min(max_age, data_ttl(interval))
+
+    # Reruns within the same ttl window share one cache entry per symbol.
+    # Every miss starts downloading before any result is awaited, so a batch
+    # costs the slowest request rather than the sum of them.
+    window = int(time.time() // ttl)
+    futures = {sym: _download(sym, period, interval, window) for sym in symbols}
+
+    frames = {}
+    for sym, future in futures.items():
+        try:
+            df = future.result()
+        except DownloadFailed:
+            # Drop the cached Future so the next rerun downloads this symbol again
+            _download.clear(sym, period, interval, window)
+            continue
+        if not df.empty:
+            frames[sym] = df
+    return frames
+
+# A live session starts a new window every refresh (as often as every 2s), and an
+# old window is never hit again, so entries are capped rather than left to the ttl
+@st.cache_resource(ttl=300, max_entries=128, show_spinner=False)
+def _download(symbol, period, interval, window):
+    """
+    One symbol's download as a Future; `window` only partitions the cache by time.
+    Frames are shared by every session (not copied), so callers must not mutate them.
+    """
+    # Resolved here on the script thread; pool threads have no Streamlit context
+    return fetch_shared(symbol, period, interval, http_session())
+
+# Live ticks only re-download this much history and splice it onto what is held
+TAIL_PERIOD = "1d"
+# Holdings are always valued from their latest 1-minute bar, whatever the chart shows
+QUOTE_PERIOD, QUOTE_INTERVAL = "1d", "1m"
+
+def get_live_data(symbols, period, interval, max_age):
+    """
+    Live-mode get_data: each symbol's full window is downloaded once per session,
+    then every tick only fetches the last TAIL_PERIOD of bars and splices them in.
+    """
+    if period == TAIL_PERIOD:
+        return get_data(symbols, period, interval, max_age)
+
+    store = st.session_state.get('live_frames', {})
+    warm = tuple(sym for sym in symbols if (sym, period, interval) in store)
+    tails = get_data(warm, TAIL_PERIOD, interval, max_age)
+
+    frames = {}
+    for sym in warm:
+        hist, tail = store[(sym, period, interval)], tails.get(sym)
+        if tail is None:
+            frames[sym] = hist
+        elif tail.index[0] <= hist.index[-1]:
+            # Fresh bars replace the stored ones they overlap; the window keeps its length
+            frames[sym] = pd.concat([hist[hist.index < tail.index[0]], tail]).iloc[-len(hist):]
+        # No overlap (e.g. a new trading day): fall through to a full download
+
+    cold = tuple(sym for sym in symbols if sym not in frames)
+    frames.update(get_data(cold, period, interval, max_age))
+
+    st.session_state.live_frames = {(sym, period, interval): df for sym, df in frames.items()}
+    return frames
+
+def fill_last_good(frames, symbols, period, interval):
+    """
+    Fills symbols whose download failed with the last frame this session got for
+    them, so a transient outage keeps the previous chart instead of blanking it.
+    Returns (frames, stale), where stale lists the symbols served from that fallback.
+    Each (period, interval) keeps the frames of its latest call, so the chart and
+    the holdings' quotes each have their own fallback.
+    """
+    store = st.session_state.get('last_good', {})
+    stale = tuple(sym for sym in symbols if sym not in frames and (sym, period, interval) in store)
+    frames = {**{sym: store[(sym, period, interval)] for sym in stale}, **frames}
+
+    store = {key: df for key, df in store.items() if key[1:] != (period, interval)}
+    store.update({(sym, period, interval): df for sym, df in frames.items()})
+    st.session_state.last_good = store
+    return frames, stale
+
+# -----------------------------------------------------------------------------
+# 3. Chart
+# -----------------------------------------------------------------------------
+# SVG candlesticks stall the browser past a few thousand bars; above GL_BARS the
+# chart is drawn with WebGL instead, and above MAX_BARS it is bucketed down first.
+GL_BARS = 2000
+MAX_BARS = 10000
+SMA_WINDOW = 20
+# Theme-independent layout; build_fig adds the theme's axis colours and template
+CHART_LAYOUT = dict(
+    height=500, margin=dict(t=20, b=0, l=0, r=0),
+    paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)'
+)
+
+def rolling_mean(values, window):
+    """
+    Trailing mean in one O(N) pass: differences of a cumulative sum,
+    with no per-window allocation. The first window-1 points are NaN, and so is
+    any window holding a NaN (pandas' default min_periods=window); NaNs are summed
+    as zero and counted separately, so one bad bar does not blank the rest.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        valid = ~np.isnan(values)
+        cs = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+        n_valid = np.concatenate(([0], np.cumsum(valid)))
+        full = (n_valid[window:] - n_valid[:-window]) == window
+        out[window - 1:] = np.where(full, (cs[window:] - cs[:-window]) / window, np.nan)
+    return out
+
+def downsample_ohlc(df, n_bars):
+    """Merges consecutive bars into at most n_bars buckets (first open, max high, min low, last close)."""
+    step = -(-len(df) // n_bars) # ceil division
+    buckets = df[['Open', 'High', 'Low', 'Close', 'SMA']].groupby(np.arange(len(df)) // step).agg(
+        {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'SMA': 'last'}
+    )
+    buckets.index = df.index[::step]
+    return buckets
+
+def axis_ms(index):
+    """
+    Bar timestamps as wall-clock epoch milliseconds. Plotly's date axis reads
+    these as one binary float64 array instead of an ISO string per point (it
+    ignores UTC offsets in those strings anyway, so the chart looks the same).
+    """
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.as_unit('ms').asi8.astype(np.float64)
+
+def gl_candles(df, theme):
+    """
+    Candlesticks as four Scattergl traces (up/down wicks and bodies).
+    Every bar is a vertical segment in one long array, split by NaN gaps,
+    so the browser makes one WebGL draw per trace instead of N SVG nodes.
+    """
+    import plotly.graph_objs as go
+
+    traces = []
+    up = (df['Close'] >= df['Open']).to_numpy()
+    for mask, color in ((up, theme['up']), (~up, theme['down'])):
+        bars = df[mask]
+        x = np.repeat(axis_ms(bars.index), 3)
+        for lo, hi, width in (('Low', 'High', 1), ('Open', 'Close', 3)):
+            y = np.full(3 * len(bars), np.nan, dtype=np.float32)
+            y[0::3] = bars[lo].to_numpy()
+            y[1::3] = bars[hi].to_numpy()
+            traces.append(go.Scattergl(
+                x=x, y=y, mode='lines', line=dict(color=color, width=width),
+                showlegend=False, hoverinfo='x+y'
+            ))
+    return traces
+
+# A chart only changes when its bars do: key it on row count, first timestamp and
+# last close rather than hashing every cell of the frame. Live ticks move the last
+# close almost every rerun, so the cache is bounded or stale figures pile up.
+@st.cache_resource(
+    max_entries=32, ttl=600,
+    hash_funcs={pd.DataFrame: lambda d: (len(d), d.index[0], d['Close'].iat[-1])}
+)
+def build_fig(df, symbol, theme):
+    """Builds the candlestick Figure once per distinct dataset; reruns reuse it."""
+    import plotly.graph_objs as go
+
+    # SMA over the full-resolution closes, before any downsampling; the cumsum runs
+    # in float64, then the chart's copy drops to float32, halving the typed arrays
+    # Plotly ships to the browser. Prices used for trades stay float64.
+    sma = rolling_mean(df['Close'].to_numpy(dtype=np.float64), SMA_WINDOW)
+    df = df[['Open', 'High', 'Low', 'Close']].assign(SMA=sma).astype(np.float32)
+
+    fig = go.Figure()
+    if len(df) > GL_BARS:
+        if len(df) > MAX_BARS:
+            df = downsample_ohlc(df, GL_BARS)
+        fig.add_traces(gl_candles(df, theme))
+        line = go.Scattergl
+    else:
+        # Hand Plotly plain ndarrays so it skips its Series conversion per column
+        fig.add_trace(go.Candlestick(
+            x=axis_ms(df.index), open=df['Open'].to_numpy(), high=df['High'].to_numpy(),
+            low=df['Low'].to_numpy(), close=df['Close'].to_numpy(), name=symbol,
+            increasing_line_color=theme['up'], decreasing_line_color=theme['down']
+        ))
+        line = go.Scatter
+    fig.add_trace(line(
+        x=axis_ms(df.index), y=df['SMA'].to_numpy(), mode='lines', name=f"SMA{SMA_WINDOW}",
+        line=dict(color=theme['sma'], width=1)
+    ))
+    fig.update_layout(
+        **CHART_LAYOUT,
+        xaxis=dict(type='date', showgrid=False, color=theme['axis']),
+        yaxis=dict(showgrid=True, gridcolor=theme['grid'], color=theme['axis']),
+        template=theme['template']
+    )
+    return fig
+
+# -----------------------------------------------------------------------------
+# 4. Trading
+# -----------------------------------------------------------------------------
+def holding_index(symbol):
+    """Position of symbol in the portfolio arrays, or -1 if it is not held."""
+    symbols = st.session_state.portfolio['symbols']
+    idx = int(np.searchsorted(symbols, symbol))
+    if idx < symbols.size and symbols[idx] == symbol:
+        return idx
+    return -1
+
+def log_transaction(action, symbol, price, qty, total):
+    """Appends one row to the end of the history DataFrame (no rebuild, no sort)."""
+    hist = st.session_state.hist_df
+    symbols = hist['Symbol'].cat.categories
+    if symbol not in symbols:
+        hist = hist.astype({'Symbol': pd.CategoricalDtype(symbols.append(pd.Index([symbol])))})
+
+    # Epoch nanoseconds go straight into the int64-backed datetime64[ns] column,
+    # so no datetime object is built and Date sorts/compares as plain int64.
+    now = np.datetime64(time.time_ns(), 'ns')
+
+    # Concat a one-row frame of identical dtypes; .loc enlargement would drop the categoricals
+    row = pd.DataFrame(
+        [(now, action, symbol, price, qty, total)], columns=hist.columns
+    ).astype(hist.dtypes.to_dict())
+    st.session_state.hist_df = pd.concat([hist, row], ignore_index=True)
+
+def value_portfolio(qty, avg_cents, current_cents):
+    """
+    Valuation kernel over the portfolio arrays (all values in cents).
+    Returns (market value per holding, unrealized P/L per holding, total equity).
+    """
+    market_cents = current_cents * qty
+    pnl_cents = market_cents - avg_cents * qty
+    return market_cents, pnl_cents, int(market_cents.sum())
+
+def execute_trade(action, symbol, price, qty):
+    """
+    Executes trade in integer cents, so balance/cost/avg math is exact
+    and never drifts (e.g., 99999.99999) - no rounding after each step.
+    """
+    price_cents = int(round(price * 100))
+    cost_cents = price_cents * qty
+    port = st.session_state.portfolio
+    idx = holding_index(symbol)
+    
+    if action == "BUY":
+        if st.session_state.balance_cents >= cost_cents:
+            # Deduct Cash
+            st.session_state.balance_cents -= cost_cents
+            
+            # Update Portfolio
+            if idx >= 0:
+                old_qty = port['qty'][idx]
+                old_avg = port['avg_cents'][idx]
+                
+                # Calculate new weighted average, rounded half-up to the cent
+                # (Old Total Val + New Cost) / Total Qty
+                new_qty = old_qty + qty
+                new_avg = (2 * (old_avg * old_qty + cost_cents) + new_qty) // (2 * new_qty)
+                
+                port['qty'][idx] = new_qty
+                port['avg_cents'][idx] = new_avg
+            else:
+                # Insert at the sorted position so searchsorted keeps working
+                pos = np.searchsorted(port['symbols'], symbol)
+                port['symbols'] = np.insert(port['symbols'], pos, symbol)
+                port['qty'] = np.insert(port['qty'], pos, qty)
+                port['avg_cents'] = np.insert(port['avg_cents'], pos, price_cents)
+            
+            # Log
+            log_transaction("BUY", symbol, price_cents / 100, qty, -cost_cents / 100)
+            st.success(f"Bought {qty} {symbol} @ ${price_cents / 100:.2f}")
+        else:
+            st.error("❌ Insufficient Funds")
+            
+    elif action == "SELL":
+        if idx >= 0 and port['qty'][idx] >= qty:
+            # Add Cash
+            st.session_state.balance_cents += cost_cents
+            
+            # Update Portfolio
+            port['qty'][idx] -= qty
+            
+            # Remove if 0
+            if port['qty'][idx] == 0:
+                for key in ('symbols', 'qty', 'avg_cents'):
+                    port[key] = np.delete(port[key], idx)
+            
+            # Log
+            log_transaction("SELL", symbol, price_cents / 100, qty, cost_cents / 100)
+            st.success(f"Sold {qty} {symbol} @ ${price_cents / 100:.2f}")
+        else:
+            st.error("❌ Insufficient Shares")
+
+# -----------------------------------------------------------------------------
+# 5. Portfolio View (FIXED VALUATION)
+# -----------------------------------------------------------------------------
+def render_portfolio(quotes, symbol, latest_close):
+    """
+    Renders the Portfolio tab: net worth metric plus the holdings table.
+    quotes holds the held symbols' QUOTE_PERIOD/QUOTE_INTERVAL frames.
+    latest_close is the active symbol's price, or None if its chart data is missing.
+    """
+    port = st.session_state.portfolio
+    if port['symbols'].size:
+        # To fix the "Math Error", we need REAL TIME prices for EVERYTHING in the portfolio
+        # not just the active stock.
+
+        # Latest 1-minute closes (in cents), independent of the chart's period/interval.
+        # Missing tickers fall back to their avg price below.
+        live_cents = {
+            sym: int(round(quotes[sym]['Close'].to_numpy()[-1] * 100))
+            for sym in port['symbols'] if sym in quotes
+        }
+        # One unconditional write for the active symbol, using the exact price
+        # trades execute at, instead of a per-row check inside the loop
+        if latest_close is not None:
+            live_cents[symbol] = int(round(latest_close * 100))
+
+        # Current prices aligned with the portfolio arrays
+        current_cents = pd.Series(live_cents, dtype='float64').reindex(port['symbols']).to_numpy()
+        unpriced = port['symbols'][np.isnan(current_cents)]
+        if unpriced.size:
+            st.warning(f"No current price for {', '.join(unpriced)} - valued at average cost.")
+        current_cents = np.where(np.isnan(current_cents), port['avg_cents'], current_cents).astype(np.int64)
+
+        # Valuation as whole-array integer multiplies over the parallel arrays
+        market_cents, pnl_cents, total_equity_cents = value_portfolio(
+            port['qty'], port['avg_cents'], current_cents
+        )
+
+        # Final Net Worth Calculation
+        net_worth = (st.session_state.balance_cents + total_equity_cents) / 100
+
+        st.metric("Total Net Worth", f"${net_worth:,.2f}")
+        # Symbols go in as an Arrow string index so Streamlit's Arrow serialization
+        # skips the object->Arrow transcode; the numeric columns are already zero-copy.
+        table = pd.DataFrame({
+            "Qty": port['qty'],
+            "Avg Cost": port['avg_cents'] / 100,
+            "Current Price": current_cents / 100,
+            "Market Value": market_cents / 100,
+            "Unrealized P/L": pnl_cents / 100
+        }, index=pd.Index(port['symbols'], dtype='string[pyarrow]', name="Symbol"))
+        st.dataframe(table.style.format({
+            "Avg Cost": "${:.2f}",
+            "Current Price": "${:.2f}",
+            "Market Value": "${:,.2f}",
+            "Unrealized P/L": "${:,.2f}"
+        }), use_container_width=True)
+
+    else:
+        st.info("Portfolio is empty. Buy stocks to see them here.")